@@ -0,0 +1,14 @@
+"""
+Request body parser for the Ninja API.
+
+orjson decodes JSON in C straight from the raw request bytes, which is
+noticeably faster than the stdlib json module ninja uses by default.
+"""
+
+import orjson
+from ninja.parser import Parser
+
+
+class ORJSONParser(Parser):
+    def parse_body(self, request):
+        return orjson.loads(request.body)
@@ -0,0 +1,20 @@
+"""
+Response renderer for the Ninja API.
+
+orjson encodes straight to bytes in C, which is several times faster than
+the stdlib json encoder ninja uses by default. Types orjson does not know
+natively fall back to ninja's own encoder.
+"""
+
+import orjson
+from ninja.renderers import BaseRenderer
+from ninja.responses import NinjaJSONEncoder
+
+_fallback_encoder = NinjaJSONEncoder()
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = "application/json"
+
+    def render(self, request, data, *, response_status):
+        return orjson.dumps(data, default=_fallback_encoder.default)
@@ -18,8 +18,10 @@ from django.contrib import admin
 from django.urls import path
 from ninja import NinjaAPI
 from patients.api import router as patients_router
+from lamar_backend.parsers import ORJSONParser
+from lamar_backend.renderers import ORJSONRenderer
 
-api = NinjaAPI(title="Lamar Backend API", version="1.0")
+api = NinjaAPI(title="Lamar Backend API", version="1.0", parser=ORJSONParser(), renderer=ORJSONRenderer())
 
 # attach all routes from patients/api.py
 api.add_router("/", patients_router)
@@ -1,17 +1,30 @@
 # patients/api.py
-from ninja import Router, File
+from typing import Optional
+from ninja import Router, File, Query
 from ninja.files import UploadedFile
-from django.shortcuts import get_object_or_404
-from django.db import IntegrityError
-from django.http import JsonResponse, HttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.db import IntegrityError, connection, transaction
+from django.db.models import BooleanField, ExpressionWrapper, F, Q, TextField, Value
+from django.db.models.functions import Cast, JSONObject, Lower
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import condition
 from ninja.errors import HttpError
 from .models import Provider, Patient, Order
-from .schemas import ProviderIn, ProviderOut, PatientIn, PatientOut, OrderIn, OrderOut, PatientOrderOut
+from .schemas import ProviderIn, ProviderOut, PatientIn, PatientOut, OrderIn, OrderOut, PatientOrderOut, PatientRecordsOut
 from .care_plan_service import generate_care_plan_text, format_care_plan_with_header
-from pypdf import PdfReader
+from .records_service import extract_pdf_text
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = Router(tags=["Lamar API"])
 
+# Appended when the LLM stream fails after part of the care plan was already sent
+CARE_PLAN_INCOMPLETE_MARKER = "\n\n[Care plan generation failed; output incomplete]\n"
+
 # ---------- PROVIDERS ----------
 @router.post("/providers", response=ProviderOut)
 def create_provider(request, payload: ProviderIn):
@@ -24,50 +37,118 @@ def create_provider(request, payload: ProviderIn):
     )
     if not created and provider.name != payload.name:
         provider.name = payload.name
-        provider.save()
+        provider.save(update_fields=['name', 'updated_at'])
     return provider
 
 @router.get("/providers", response=list[ProviderOut])
 def list_providers(request):
-    return Provider.objects.all()
+    # Rows already match ProviderOut; render them directly instead of validating each model through DjangoGetter
+    providers = Provider.objects.values('id', 'name', 'npi')
+    return router.api.create_response(request, list(providers), status=200)
 
 
 # ---------- PATIENTS ----------
+def _find_duplicate_order_id(patient: Patient, medication_name: str):
+    """
+    Return the id of the patient's first order for this medication (case-insensitive), or None.
+    """
+    # Compare on LOWER(medication_name) so the lookup can use order_patient_med_lower_idx;
+    # the submitted name goes through the same LOWER() so both sides fold alike
+    return Order.objects.alias(medication_lower=Lower('medication_name')).filter(
+        patient=patient,
+        medication_lower=Lower(Value(medication_name))
+    ).values_list('id', flat=True).first()
+
+
+def _find_existing_records(payload: PatientIn):
+    """
+    Look up the provider by NPI, the patient by MRN and, for that patient, an existing
+    order for the medication, all in a single round trip.
+    Returns (provider, patient, existing_order_id); each is None when nothing matches.
+    The provider and patient carry a `name_matches` flag for the submitted names.
+    """
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        # Names are compared in SQL so both sides go through the database's LOWER()
+        cursor.execute(
+            f"""
+            SELECT pr.id, pr.name, pr.name_ci = LOWER(%s),
+                   pt.id, pt.first_name, pt.last_name,
+                   pt.first_name_ci = LOWER(%s) AND pt.last_name_ci = LOWER(%s),
+                   (SELECT MIN(o.id) FROM {qn(Order._meta.db_table)} o
+                    WHERE o.patient_id = pt.id AND LOWER(o.medication_name) = LOWER(%s))
+            FROM (SELECT 1 AS one) anchor
+            LEFT JOIN {qn(Provider._meta.db_table)} pr ON pr.npi = %s
+            LEFT JOIN {qn(Patient._meta.db_table)} pt ON pt.mrn = %s
+            """,
+            [
+                payload.referring_provider, payload.first_name, payload.last_name,
+                payload.medication_name, payload.provider_npi, payload.mrn,
+            ],
+        )
+        row = cursor.fetchone()
+
+    # from_db takes values in model field order
+    provider = None
+    if row[0] is not None:
+        provider = Provider.from_db(connection.alias, ['id', 'name', 'npi'], [row[0], row[1], payload.provider_npi])
+        provider.name_matches = bool(row[2])
+    patient = None
+    if row[3] is not None:
+        patient = Patient.from_db(
+            connection.alias,
+            ['id', 'first_name', 'last_name', 'mrn'],
+            [row[3], row[4], row[5], payload.mrn],
+        )
+        patient.name_matches = bool(row[6])
+    return provider, patient, row[7]
+
+
+def _provider_name_issue(provider: Provider, payload: PatientIn) -> dict:
+    return {
+        "existing_name": provider.name,
+        "submitted_name": payload.referring_provider,
+        "npi": payload.provider_npi
+    }
+
+
+def _patient_name_issue(patient: Patient, payload: PatientIn) -> dict:
+    return {
+        "existing_name": f"{patient.first_name} {patient.last_name}",
+        "submitted_name": f"{payload.first_name} {payload.last_name}",
+        "mrn": payload.mrn
+    }
+
+
 @router.post("/patients", response=PatientOrderOut)
+@transaction.atomic
 def create_patient(request, payload: PatientIn):
+    # Provider, patient and order writes commit together as one transaction
     # Collect all confirmation issues upfront
     confirmation_issues = {}
     
+    # Fetch any existing provider (by NPI), patient (by MRN) and duplicate order together
+    existing_provider, existing_patient, existing_order_id = _find_existing_records(payload)
+
     # Check if provider already exists with same NPI
-    existing_provider = Provider.objects.filter(npi=payload.provider_npi).first()
     provider_name_mismatch = False
     
     if existing_provider:
         # If provider exists, check if name matches
-        if existing_provider.name.lower() != payload.referring_provider.lower():
+        if not existing_provider.name_matches:
             provider_name_mismatch = True
             if not payload.confirm_provider_name_mismatch:
-                confirmation_issues['provider'] = {
-                    "existing_name": existing_provider.name,
-                    "submitted_name": payload.referring_provider,
-                    "npi": payload.provider_npi
-                }
+                confirmation_issues['provider'] = _provider_name_issue(existing_provider, payload)
     
     # Check if patient already exists by MRN
-    existing_patient = Patient.objects.filter(mrn=payload.mrn).first()
     patient_name_mismatch = False
     
     if existing_patient:
         # If patient exists, check if names match
-        if (existing_patient.first_name.lower() != payload.first_name.lower() or 
-            existing_patient.last_name.lower() != payload.last_name.lower()):
+        if not existing_patient.name_matches:
             patient_name_mismatch = True
             if not payload.confirm_patient_name_mismatch:
-                confirmation_issues['patient'] = {
-                    "existing_name": f"{existing_patient.first_name} {existing_patient.last_name}",
-                    "submitted_name": f"{payload.first_name} {payload.last_name}",
-                    "mrn": payload.mrn
-                }
+                confirmation_issues['patient'] = _patient_name_issue(existing_patient, payload)
     
     # If any confirmations are needed (patient/provider), return them together
     # Note: Order confirmation check happens AFTER patient/provider are confirmed
@@ -84,44 +165,81 @@ def create_patient(request, payload: PatientIn):
     # Handle provider
     if existing_provider:
         provider = existing_provider
-        if provider_name_mismatch:
-            provider.name = payload.referring_provider
-            provider.save()
     else:
-        provider = Provider.objects.create(
-            npi=payload.provider_npi,
-            name=payload.referring_provider
-        )
+        try:
+            with transaction.atomic():
+                provider = Provider.objects.create(
+                    npi=payload.provider_npi,
+                    name=payload.referring_provider
+                )
+        except IntegrityError:
+            # A concurrent request registered this NPI after our lookup, so check its name now
+            provider = Provider.objects.only('id', 'name').annotate(
+                name_matches=ExpressionWrapper(
+                    Q(name_ci=Lower(Value(payload.referring_provider))),
+                    output_field=BooleanField(),
+                )
+            ).get(npi=payload.provider_npi)
+            if not provider.name_matches:
+                if not payload.confirm_provider_name_mismatch:
+                    return JsonResponse({
+                        "requires_confirmation": True,
+                        "issues": {"provider": _provider_name_issue(provider, payload)}
+                    }, status=422)
+                provider_name_mismatch = True
+    
+    if provider_name_mismatch:
+        # Single-column UPDATE; no need to write back the whole row
+        Provider.objects.filter(pk=provider.pk).update(name=payload.referring_provider, updated_at=timezone.now())
+        provider.name = payload.referring_provider
     
     # Handle patient
     if existing_patient:
         patient = existing_patient
     else:
-        patient = Patient.objects.create(
-            first_name=payload.first_name,
-            last_name=payload.last_name,
-            mrn=payload.mrn,
-            primary_diagnosis=payload.primary_diagnosis,
-            additional_diagnoses=payload.additional_diagnoses,
-            medication_history=payload.medication_history,
-            records_text=payload.records_text,
-            provider=provider,
-        )
+        # The MRN lookup above already ran, so the happy path is a single INSERT.
+        # If a concurrent request inserted the same MRN in between, fall back to that row.
+        try:
+            with transaction.atomic():
+                patient = Patient.objects.create(
+                    first_name=payload.first_name,
+                    last_name=payload.last_name,
+                    mrn=payload.mrn,
+                    primary_diagnosis=payload.primary_diagnosis,
+                    additional_diagnoses=payload.additional_diagnoses,
+                    medication_history=payload.medication_history,
+                    records_text=payload.records_text,
+                    provider=provider,
+                )
+        except IntegrityError:
+            # This patient wasn't seen by the initial lookup, so check its name and orders now
+            patient = Patient.objects.only('id', 'first_name', 'last_name').annotate(
+                name_matches=ExpressionWrapper(
+                    Q(first_name_ci=Lower(Value(payload.first_name)), last_name_ci=Lower(Value(payload.last_name))),
+                    output_field=BooleanField(),
+                )
+            ).get(mrn=payload.mrn)
+            if not patient.name_matches:
+                patient_name_mismatch = True
+                if not payload.confirm_patient_name_mismatch:
+                    # Discard the provider writes above, as the up-front check would have
+                    transaction.set_rollback(True)
+                    return JsonResponse({
+                        "requires_confirmation": True,
+                        "issues": {"patient": _patient_name_issue(patient, payload)}
+                    }, status=422)
+            existing_order_id = _find_duplicate_order_id(patient, payload.medication_name)
     
-    # NOW check for existing order (after patient/provider are handled)
-    existing_order = Order.objects.filter(
-        patient=patient, 
-        medication_name__iexact=payload.medication_name
-    ).first()
-    
-    if existing_order and not payload.confirm_duplicate_order:
+    # NOW act on any existing order (after patient/provider are handled).
+    # A newly created patient has no orders, so existing_order_id stays None.
+    if existing_order_id is not None and not payload.confirm_duplicate_order:
         # Require confirmation for duplicate order
         error_response = {
             "requires_confirmation": True,
             "issues": {
                 "order": {
                     "medication_name": payload.medication_name,
-                    "existing_order_id": existing_order.id
+                    "existing_order_id": existing_order_id
                 }
             }
         }
@@ -140,7 +258,7 @@ def create_patient(request, payload: PatientIn):
         warnings.append(f"⚠️ Provider name updated from existing entry.")
     if patient_name_mismatch:
         warnings.append(f"⚠️ Order created for existing patient.")
-    if existing_order:
+    if existing_order_id is not None:
         warnings.append(f"⚠️ Duplicate order created for '{payload.medication_name}'.")
     
     if warnings:
@@ -163,81 +281,129 @@ def extract_records_text(request, file: UploadedFile = File(...)):
     """
     try:
         # UploadedFile.file is a file-like object positioned at start
-        reader = PdfReader(file)
-        texts = []
-        for page in reader.pages:
-            try:
-                texts.append(page.extract_text() or "")
-            except Exception:
-                continue
-        extracted_text = "\n\n".join([t.strip() for t in texts if t is not None])
-        return {"extracted_text": extracted_text}
+        return {"extracted_text": extract_pdf_text(file.read())}
     except Exception as e:
         return JsonResponse({"error": f"Failed to extract text: {str(e)}"}, status=400)
 
 @router.get("/patients/{patient_id}/orders/{order_id}/care-plan")
-def get_care_plan(request, patient_id: int, order_id: int):
+async def get_care_plan(request, patient_id: int, order_id: int):
     """
     Generate and download care plan as a text file for a specific order.
+    Under ASGI the header is sent first and the LLM output is streamed as it arrives;
+    under WSGI the whole plan is generated before the response is returned.
     """
-    patient = get_object_or_404(Patient, id=patient_id)
-    order = get_object_or_404(Order, id=order_id, patient=patient)
+    patient = await aget_object_or_404(Patient.objects.select_related('provider'), id=patient_id)
+    order = await aget_object_or_404(Order, id=order_id, patient=patient)
     
     try:
-        # Generate care plan text using LLM
-        care_plan_text = generate_care_plan_text(patient, order)
-        
-        # Format with header
-        formatted_text = format_care_plan_with_header(patient, order, care_plan_text)
-        
-        # Create HTTP response with text file
-        filename = f"care_plan_{patient.first_name}_{patient.last_name}_{patient.mrn}_{order.created_at.strftime('%Y%m%d')}.txt"
-        
-        response = HttpResponse(
-            formatted_text,
-            content_type='text/plain; charset=utf-8'
-        )
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        return response
+        # Start generating care plan text using LLM
+        care_plan_chunks = await generate_care_plan_text(patient, order)
+        # Wait for the first text so an empty or immediately failing completion is still a 500
+        first_chunk = await anext(care_plan_chunks)
     except Exception as e:
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.error(f"Failed to generate care plan for order {order_id}: {str(e)}")
+        return _care_plan_error(order_id, e)
+    
+    # Format with header
+    header = format_care_plan_with_header(patient, order, "")
+    
+    if isinstance(request, ASGIRequest):
+        async def stream_care_plan():
+            yield header
+            yield first_chunk
+            try:
+                async for chunk in care_plan_chunks:
+                    yield chunk
+            except Exception as e:
+                # Headers are already sent, so mark the download as cut short instead of returning a 500
+                logger.error(f"Care plan stream for order {order_id} failed: {str(e)}")
+                yield CARE_PLAN_INCOMPLETE_MARKER
         
-        # Return error response
-        return JsonResponse(
-            {"error": f"Failed to generate care plan: {str(e)}"},
-            status=500
+        response = StreamingHttpResponse(
+            stream_care_plan(),
+            content_type='text/plain; charset=utf-8'
         )
+    else:
+        # Under WSGI this view runs on a temporary event loop that is closed before Django
+        # iterates the response, so the open stream has to be read to the end here
+        try:
+            care_plan_text = first_chunk + "".join([chunk async for chunk in care_plan_chunks])
+        except Exception as e:
+            return _care_plan_error(order_id, e)
+        response = HttpResponse(header + care_plan_text, content_type='text/plain; charset=utf-8')
+    
+    # Attach as a text file
+    filename = f"care_plan_{patient.first_name}_{patient.last_name}_{patient.mrn}_{order.created_at.strftime('%Y%m%d')}.txt"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    
+    return response
+
+
+def _care_plan_error(order_id: int, error: Exception) -> JsonResponse:
+    logger.error(f"Failed to generate care plan for order {order_id}: {str(error)}")
+    return JsonResponse(
+        {"error": f"Failed to generate care plan: {str(error)}"},
+        status=500
+    )
+
+def _list_etag(*parts) -> str:
+    """
+    Build a weak ETag from the values that identify a list page's contents.
+    """
+    return 'W/"' + hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest() + '"'
+
+
+def _after_cursor(queryset, cursor):
+    """
+    Order by id and keep only rows after the cursor id, if one is given.
+    """
+    queryset = queryset.order_by('id')
+    if cursor is not None:
+        queryset = queryset.filter(id__gt=cursor)
+    return queryset
+
+
+def _patients_etag(request, cursor=None, limit=100):
+    # Scoped to the requested page, read by primary key, so the cost follows `limit`
+    # rather than table size. Patient edits and provider renames bump updated_at.
+    page = _after_cursor(Patient.objects, cursor).values_list('id', 'updated_at', 'provider__updated_at')
+    return _list_etag(cursor, limit, list(page[:limit]))
+
 
 @router.get("/patients", response=list[PatientOut])
-def list_patients(request):
-    patients = Patient.objects.all()
-    return [
-        PatientOut(
-            id=p.id,
-            first_name=p.first_name,
-            last_name=p.last_name,
-            mrn=p.mrn,
-            primary_diagnosis=p.primary_diagnosis,
-            referring_provider=p.provider.name,
-            provider_npi=p.provider.npi,
-            provider_id=p.provider.id,
-            additional_diagnoses=p.additional_diagnoses or [],
-            medication_history=p.medication_history or [],
-            records_text=p.records_text or "",
-        )
-        for p in patients
-    ]
+@condition(etag_func=_patients_etag)
+def list_patients(request, cursor: Optional[int] = None, limit: int = Query(100, ge=1, le=1000)):
+    """
+    List patients ordered by id, one page at a time.
+    Pass the last id of a page as `cursor` to fetch the next page.
+    """
+    # Project straight to dicts (provider columns come from the same JOIN) to skip model hydration.
+    # records_text is left out; it can be large and is served by /patients/{id}/records.
+    patients = _after_cursor(Patient.objects, cursor).values(
+        'id', 'first_name', 'last_name', 'mrn', 'primary_diagnosis',
+        'additional_diagnoses', 'medication_history', 'provider_id',
+        referring_provider=F('provider__name'),
+        provider_npi=F('provider__npi'),
+    )
+    rows = list(patients[:limit])
+    for row in rows:
+        row['additional_diagnoses'] = row['additional_diagnoses'] or []
+        row['medication_history'] = row['medication_history'] or []
+    # Rows already match PatientOut; render them directly rather than re-validating each one
+    return router.api.create_response(request, rows, status=200)
+
+@router.get("/patients/{patient_id}/records", response=PatientRecordsOut)
+def get_patient_records(request, patient_id: int):
+    patient = get_object_or_404(Patient.objects.only('id', 'records_text'), id=patient_id)
+    return PatientRecordsOut(id=patient.id, records_text=patient.records_text or "")
 
 
 # ---------- ORDERS ----------
 @router.post("/orders", response=OrderOut)
 def create_order(request, payload: OrderIn):
-    patient = get_object_or_404(Patient, id=payload.patient_id)
-    existing = Order.objects.filter(
-        patient=patient, medication_name__iexact=payload.medication_name
+    # Only the id is used; skip loading records_text and the JSON columns
+    patient = get_object_or_404(Patient.objects.only('id'), id=payload.patient_id)
+    existing = Order.objects.alias(medication_lower=Lower('medication_name')).filter(
+        patient=patient, medication_lower=Lower(Value(payload.medication_name))
     )
     warning = None
     if existing.exists():
@@ -250,15 +416,89 @@ def create_order(request, payload: OrderIn):
         warning=warning
     )
 
-@router.get("/orders", response=list[OrderOut])
-def list_orders(request):
-    orders = Order.objects.all()
+def _lower_in_db(values) -> dict:
+    """
+    Map each string to its LOWER() as computed by the database.
+    """
+    values = list(values)
+    lowered = {}
+    with connection.cursor() as cursor:
+        # Batched to stay well under parameter and select-list limits
+        for start in range(0, len(values), 500):
+            batch = values[start:start + 500]
+            cursor.execute("SELECT " + ", ".join(["LOWER(%s)"] * len(batch)), batch)
+            lowered.update(zip(batch, cursor.fetchone()))
+    return lowered
+
+@router.post("/orders/bulk", response=list[OrderOut])
+def create_orders_bulk(request, payload: list[OrderIn]):
+    """
+    Create many orders in batched INSERTs.
+    Duplicates (existing or earlier in the same payload) are still created, with a warning, like POST /orders.
+    """
+    patient_ids = {item.patient_id for item in payload}
+    found_ids = set(Patient.objects.filter(id__in=patient_ids).values_list('id', flat=True))
+    missing_ids = patient_ids - found_ids
+    if missing_ids:
+        raise HttpError(404, f"Patients not found: {sorted(missing_ids)}")
+
+    # Key everything on the database's LOWER() so payload names and stored names fold alike
+    lowered = _lower_in_db({item.medication_name for item in payload})
+
+    # One query for all (patient, medication) pairs that already exist
+    seen = set(
+        Order.objects.annotate(medication_lower=Lower('medication_name'))
+        .filter(
+            patient_id__in=patient_ids,
+            medication_lower__in=set(lowered.values()),
+        )
+        .values_list('patient_id', 'medication_lower')
+    )
+
+    orders = []
+    warnings = []
+    for item in payload:
+        key = (item.patient_id, lowered[item.medication_name])
+        warning = None
+        if key in seen:
+            warning = f"⚠️ Similar order for '{item.medication_name}' already exists for this patient."
+        seen.add(key)
+        orders.append(Order(patient_id=item.patient_id, medication_name=item.medication_name))
+        warnings.append(warning)
+
+    Order.objects.bulk_create(orders, batch_size=500)
     return [
         OrderOut(
-            id=o.id,
-            patient_id=o.patient.id,
-            medication_name=o.medication_name,
-            warning=None
+            id=order.id,
+            patient_id=order.patient_id,
+            medication_name=order.medication_name,
+            warning=warning
         )
-        for o in orders
+        for order, warning in zip(orders, warnings)
     ]
+
+def _orders_etag(request, cursor=None, limit=100):
+    # Orders are never edited, so the page's ids identify its contents
+    page = _after_cursor(Order.objects, cursor).values_list('id', flat=True)
+    return _list_etag(cursor, limit, list(page[:limit]))
+
+
+@router.get("/orders", response=list[OrderOut])
+@condition(etag_func=_orders_etag)
+def list_orders(request, cursor: Optional[int] = None, limit: int = Query(100, ge=1, le=1000)):
+    """
+    List orders ordered by id, one page at a time.
+    Pass the last id of a page as `cursor` to fetch the next page.
+    """
+    orders = _after_cursor(Order.objects, cursor)
+    # The database builds each OrderOut-shaped JSON object; we only stitch them into an array
+    rows = orders.annotate(
+        row_json=Cast(
+            JSONObject(id='id', patient_id='patient_id', medication_name='medication_name', warning=Value(None)),
+            TextField(),
+        )
+    ).values_list('row_json', flat=True)[:limit]
+    body = "[" + ",".join(rows) + "]"
+    # Same Content-Type the API renderer sends for every other endpoint
+    renderer = router.api.renderer
+    return HttpResponse(body, content_type=f"{renderer.media_type}; charset={renderer.charset}")
@@ -1,20 +1,38 @@
 # patients/care_plan_service.py
+import asyncio
+import hashlib
 import os
-from openai import OpenAI
+import weakref
+from typing import AsyncIterator
+from openai import AsyncOpenAI
 from django.conf import settings
+from django.core.cache import cache
 from .models import Patient, Order
 
+# One client per event loop: its connection pool can't be shared across loops
+_clients = weakref.WeakKeyDictionary()
 
-def generate_care_plan_text(patient: Patient, order: Order) -> str:
+
+def _get_client(api_key: str) -> AsyncOpenAI:
+    """
+    Return the OpenAI client for the running event loop, creating it on first use
+    so connections (and TLS sessions) are reused across care-plan requests.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = AsyncOpenAI(api_key=api_key)
+    return client
+
+
+async def generate_care_plan_text(patient: Patient, order: Order) -> AsyncIterator[str]:
     """
     Generate care plan text using LLM based on patient data and order information.
+    Opens a streaming completion and returns an async iterator over the text chunks,
+    so request/auth failures surface here rather than mid-stream.
+    `patient.provider` must already be loaded (select_related) since this runs async.
+    Output is cached by a hash of the prompt, so repeat downloads skip the LLM call.
     """
-    api_key = os.environ.get('OPENAI_API_KEY')
-    if not api_key:
-        raise Exception("OPENAI_API_KEY environment variable is not set")
-    
-    client = OpenAI(api_key=api_key)
-    
     # Build patient information context
     additional_diagnoses_str = ', '.join(patient.additional_diagnoses) if patient.additional_diagnoses else "None"
     medication_history_str = ', '.join(patient.medication_history) if patient.medication_history else "None"
@@ -62,24 +80,53 @@ Generate a detailed, clinically appropriate care plan for this patient receiving
 Base your recommendations on standard clinical practice guidelines and the patient's specific information provided.
 Make it comprehensive and actionable for clinical staff."""
 
+    # The prompt carries every input that shapes the output, and temperature is 0
+    cache_key = "care_plan:" + hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+    cached_text = await cache.aget(cache_key)
+    if cached_text is not None:
+        return _iter_cached_text(cached_text)
+    
+    api_key = os.environ.get('OPENAI_API_KEY')
+    if not api_key:
+        raise Exception("OPENAI_API_KEY environment variable is not set")
+    
+    client = _get_client(api_key)
+
     try:
-        response = client.chat.completions.create(
+        stream = await client.chat.completions.create(
             model="gpt-4o",  # or "gpt-4-turbo" or "gpt-3.5-turbo" for cost savings
             messages=[
                 {"role": "system", "content": "You are an experienced clinical pharmacist specializing in specialty medications and care plan development."},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.7,
-            max_tokens=3000
+            temperature=0,
+            max_tokens=3000,
+            stream=True
         )
-        
-        content = response.choices[0].message.content
-        if not content:
-            raise Exception("LLM returned empty response")
-        
-        return content
     except Exception as e:
         raise Exception(f"Failed to generate care plan: {str(e)}")
+    
+    return _iter_stream_text(stream, cache_key)
+
+
+async def _iter_stream_text(stream, cache_key: str) -> AsyncIterator[str]:
+    """
+    Yield the text deltas from a streaming chat completion.
+    The full text is cached once the stream completes without error;
+    a stream that carries no text at all raises instead.
+    """
+    parts = []
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            yield parts[-1]
+    if not parts:
+        raise Exception("LLM returned empty response")
+    await cache.aset(cache_key, "".join(parts), timeout=None)
+
+
+async def _iter_cached_text(text: str) -> AsyncIterator[str]:
+    yield text
 
 
 def format_care_plan_with_header(patient: Patient, order: Order, care_plan_text: str) -> str:
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-15 10:04
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(models.F('patient'), django.db.models.functions.text.Lower('medication_name'), name='order_patient_med_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-15 10:41
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0002_order_patient_med_lower_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='first_name_ci',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Lower('first_name'), output_field=models.CharField(max_length=100)),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='last_name_ci',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Lower('last_name'), output_field=models.CharField(max_length=100)),
+        ),
+        migrations.AddField(
+            model_name='provider',
+            name='name_ci',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Lower('name'), output_field=models.CharField(max_length=255)),
+        ),
+    ]
@@ -1,13 +1,21 @@
 from django.db import models
 from django.core.validators import RegexValidator
+from django.db.models.functions import Lower
 
 class Provider(models.Model):
     name = models.CharField(max_length=255)
+    # Lowercased copy maintained by the database, for case-insensitive name checks
+    name_ci = models.GeneratedField(
+        expression=Lower('name'),
+        output_field=models.CharField(max_length=255),
+        db_persist=True,
+    )
     npi = models.CharField(
         max_length=10,
         unique=True,
         validators=[RegexValidator(r'^\d{10}$', 'NPI must be 10 digits')]
     )
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.name} (NPI: {self.npi})"
@@ -16,6 +24,17 @@ class Provider(models.Model):
 class Patient(models.Model):
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
+    # Lowercased copies maintained by the database, for case-insensitive name checks
+    first_name_ci = models.GeneratedField(
+        expression=Lower('first_name'),
+        output_field=models.CharField(max_length=100),
+        db_persist=True,
+    )
+    last_name_ci = models.GeneratedField(
+        expression=Lower('last_name'),
+        output_field=models.CharField(max_length=100),
+        db_persist=True,
+    )
     mrn = models.CharField(
         max_length=6,
         unique=True,
@@ -29,6 +48,7 @@ class Patient(models.Model):
     provider = models.ForeignKey(
         Provider, on_delete=models.PROTECT, related_name='patients'
     )
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} (MRN: {self.mrn})"
@@ -38,6 +58,12 @@ class Order(models.Model):
     medication_name = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Backs the per-patient, case-insensitive duplicate-order checks
+            models.Index('patient', Lower('medication_name'), name='order_patient_med_lower_idx'),
+        ]
+
     def __str__(self):
         return f"Order for {self.patient} - {self.medication_name}"
 
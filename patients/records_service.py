@@ -0,0 +1,123 @@
+# patients/records_service.py
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+import pypdfium2 as pdfium
+
+# Below this page count, shipping the PDF to worker processes costs more than it saves
+PARALLEL_PAGE_THRESHOLD = 4
+MAX_WORKERS = os.cpu_count() or 1
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """
+    Return the shared process pool, creating it on first use.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Start workers from a clean server process rather than forking this
+            # (possibly multi-threaded) web process
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _executor = ProcessPoolExecutor(
+                max_workers=MAX_WORKERS,
+                mp_context=multiprocessing.get_context(method),
+            )
+        return _executor
+
+
+def _discard_executor(executor: ProcessPoolExecutor) -> None:
+    """
+    Drop a broken pool so the next _get_executor() call builds a fresh one.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def _extract_page_range(raw_pdf: bytes, start: int, stop: int) -> List[Optional[str]]:
+    """
+    Extract text for pages [start, stop). A page that fails to extract is returned as None.
+    May run in a worker process, so it opens the PDF from raw bytes itself.
+    """
+    pdf = pdfium.PdfDocument(raw_pdf)
+    texts = []
+    try:
+        for i in range(start, stop):
+            page = textpage = None
+            try:
+                page = pdf[i]
+                textpage = page.get_textpage()
+                # PDFium separates lines with CRLF
+                texts.append(textpage.get_text_bounded().replace("\r\n", "\n"))
+            except Exception:
+                texts.append(None)
+            finally:
+                if textpage is not None:
+                    textpage.close()
+                if page is not None:
+                    page.close()
+    finally:
+        pdf.close()
+    return texts
+
+
+def _extract_in_pool(raw_pdf: bytes, num_pages: int) -> List[Optional[str]]:
+    """
+    Extract all pages across the process pool, split into contiguous page ranges.
+    A worker dying (OOM kill, PDFium crash) breaks the whole pool; it is then replaced
+    and the document retried once. A second failure is raised rather than retrying
+    in-process, since the PDF itself may be what crashed the worker.
+    """
+    workers = min(MAX_WORKERS, num_pages)
+    bounds = [num_pages * i // workers for i in range(workers + 1)]
+    for attempt in range(2):
+        executor = _get_executor()
+        try:
+            chunks = executor.map(
+                _extract_page_range,
+                [raw_pdf] * workers,
+                bounds[:-1],
+                bounds[1:],
+            )
+            return [text for chunk in chunks for text in chunk]
+        except BrokenProcessPool:
+            _discard_executor(executor)
+            if attempt:
+                raise
+
+
+def extract_pdf_text(raw_pdf: bytes) -> str:
+    """
+    Extract plain text from a PDF, pages separated by blank lines.
+    Pages that fail to extract are skipped. Larger documents are split into
+    contiguous page ranges and extracted in parallel across processes.
+    """
+    pdf = pdfium.PdfDocument(raw_pdf)
+    num_pages = len(pdf)
+    pdf.close()
+
+    if num_pages > PARALLEL_PAGE_THRESHOLD:
+        texts = _extract_in_pool(raw_pdf, num_pages)
+    else:
+        texts = _extract_page_range(raw_pdf, 0, num_pages)
+
+    # Write pages straight into one buffer instead of collecting a list and joining it
+    buffer = io.StringIO()
+    separator = ""
+    for text in texts:
+        if text is None:
+            continue
+        buffer.write(separator)
+        buffer.write(text.strip())
+        separator = "\n\n"
+    return buffer.getvalue()
@@ -9,33 +9,32 @@ class ProviderIn(Schema):
 class ProviderOut(ProviderIn):
     id: int
 
-class PatientIn(Schema):
+class PatientBase(Schema):
     first_name: str
     last_name: str
     mrn: str
     primary_diagnosis: str
     referring_provider: str
     provider_npi: str
-    medication_name: str
     additional_diagnoses: List[str] = []
     medication_history: List[str] = []
+
+
+class PatientIn(PatientBase):
+    medication_name: str
     records_text: str = ""
     confirm_patient_name_mismatch: bool = False  # Flag to confirm proceeding when MRN exists but patient names don't match
     confirm_provider_name_mismatch: bool = False  # Flag to confirm proceeding when NPI exists but provider name doesn't match
     confirm_duplicate_order: bool = False  # Flag to confirm proceeding when duplicate order exists
 
 
-class PatientOut(Schema):
+class PatientOut(PatientBase):
     id: int
-    first_name: str
-    last_name: str
-    mrn: str
-    primary_diagnosis: str
-    referring_provider: str
-    provider_npi: str
     provider_id: int  # Keep for backward compatibility and direct database reference
-    additional_diagnoses: List[str] = []
-    medication_history: List[str] = []
+
+
+class PatientRecordsOut(Schema):
+    id: int
     records_text: str = ""
 
 
@@ -1,26 +1,107 @@
 # patients/tests.py
-from django.test import TestCase, Client
+from django.test import TestCase, tag
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from io import BytesIO
+from types import MappingProxyType, SimpleNamespace
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import addModuleCleanup, mock
+from . import records_service
+from .api import CARE_PLAN_INCOMPLETE_MARKER, _find_existing_records
 from .models import Provider, Patient, Order
 import json
+import os
+import threading
+import orjson
+from openai import AsyncOpenAI
+
+
+def _build_pdf(*page_texts):
+    """
+    Assemble a minimal PDF with one line of Helvetica text per page.
+    """
+    count = len(page_texts)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % (4 + 2 * i) for i in range(count)) + b"] /Count %d >>" % count,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(page_texts):
+        content = b"BT /F1 12 Tf 72 720 Td (%s) Tj ET" % text.encode()
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 3 0 R >> >> >>" % (5 + 2 * i)
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return pdf
+
+
+# Built once at import and shared by the upload tests
+_MINIMAL_PDF_BYTES = _build_pdf("Patient records")
+# Enough pages to take the process-pool path in records_service
+_MULTI_PAGE_PDF_TEXTS = tuple(f"Page {n}" for n in range(1, 8))
+_MULTI_PAGE_PDF_BYTES = _build_pdf(*_MULTI_PAGE_PDF_TEXTS)
+
+
+# Values shared by most fixtures and payloads below
+_NPI = "1234567890"
+_MRN = "123456"
+_MED = "IVIG"
+_DX = "G70.00"
+
+# Default POST /api/patients payload; read-only so tests copy it before mutating
+_BASE_PATIENT_DATA = MappingProxyType({
+    "first_name": "John",
+    "last_name": "Doe",
+    "mrn": _MRN,
+    "primary_diagnosis": _DX,
+    "referring_provider": "Dr. Smith",
+    "provider_npi": _NPI,
+    "medication_name": _MED,
+    "additional_diagnoses": ("I10",),
+    "medication_history": ("Aspirin",),
+    "records_text": "Patient records here",
+    "confirm_patient_name_mismatch": False,
+    "confirm_provider_name_mismatch": False,
+    "confirm_duplicate_order": False
+})
+
+
+def setUpModule():
+    # Any test that reaches the real OpenAI client instead of mocking _get_client fails fast
+    patcher = mock.patch(
+        "patients.care_plan_service.AsyncOpenAI",
+        side_effect=RuntimeError("Tests must not call OpenAI; patch patients.care_plan_service._get_client"),
+    )
+    patcher.start()
+    addModuleCleanup(patcher.stop)
 
 
 class ProviderAPITests(TestCase):
     def setUp(self):
-        self.client = Client()
         self.provider_data = {
             "name": "Dr. Smith",
-            "npi": "1234567890"
+            "npi": _NPI
         }
 
     def test_create_provider_success(self):
         """Test creating a new provider"""
         response = self.client.post("/api/providers", data=json.dumps(self.provider_data), content_type="application/json")
         self.assertEqual(response.status_code, 200)
-        data = response.json()
+        data = orjson.loads(response.content)
         self.assertEqual(data["name"], "Dr. Smith")
-        self.assertEqual(data["npi"], "1234567890")
+        self.assertEqual(data["npi"], _NPI)
         self.assertIn("id", data)
         # Verify it was saved
         self.assertEqual(Provider.objects.count(), 1)
@@ -28,12 +109,12 @@ class ProviderAPITests(TestCase):
     def test_create_provider_duplicate_npi(self):
         """Test that duplicate NPI updates existing provider"""
         # Create first provider
-        Provider.objects.create(name="Dr. Smith", npi="1234567890")
+        Provider.objects.create(name="Dr. Smith", npi=_NPI)
         
         # Try to create same provider with different name
         response = self.client.post("/api/providers", data=json.dumps({
             "name": "Dr. John Smith",
-            "npi": "1234567890"
+            "npi": _NPI
         }), content_type="application/json")
         self.assertEqual(response.status_code, 200)
         # get_or_create should return existing one, not create new
@@ -43,47 +124,63 @@ class ProviderAPITests(TestCase):
         """Test listing providers when none exist"""
         response = self.client.get("/api/providers")
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json(), [])
+        self.assertEqual(orjson.loads(response.content), [])
 
     def test_list_providers_with_data(self):
         """Test listing providers"""
-        Provider.objects.create(name="Dr. Smith", npi="1234567890")
-        Provider.objects.create(name="Dr. Jones", npi="0987654321")
+        Provider.objects.bulk_create([
+            Provider(name="Dr. Smith", npi=_NPI),
+            Provider(name="Dr. Jones", npi="0987654321"),
+        ])
         
         response = self.client.get("/api/providers")
         self.assertEqual(response.status_code, 200)
-        data = response.json()
+        data = orjson.loads(response.content)
         self.assertEqual(len(data), 2)
         npis = [p["npi"] for p in data]
-        self.assertIn("1234567890", npis)
+        self.assertIn(_NPI, npis)
         self.assertIn("0987654321", npis)
 
 
 class PatientAPITests(TestCase):
+    # Most tests post the payload unchanged, so encode it once for the class
+    base_patient_json = json.dumps(dict(_BASE_PATIENT_DATA))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.provider = Provider.objects.create(name="Dr. Smith", npi=_NPI)
+
     def setUp(self):
-        self.client = Client()
-        self.provider = Provider.objects.create(name="Dr. Smith", npi="1234567890")
-        self.patient_data = {
-            "first_name": "John",
-            "last_name": "Doe",
-            "mrn": "123456",
-            "primary_diagnosis": "G70.00",
-            "referring_provider": "Dr. Smith",
-            "provider_npi": "1234567890",
-            "medication_name": "IVIG",
-            "additional_diagnoses": ["I10"],
-            "medication_history": ["Aspirin"],
-            "records_text": "Patient records here",
-            "confirm_patient_name_mismatch": False,
-            "confirm_provider_name_mismatch": False,
-            "confirm_duplicate_order": False
-        }
+        self.patient_data = dict(_BASE_PATIENT_DATA)
+
+    def _post_patient(self):
+        if self.patient_data == _BASE_PATIENT_DATA:
+            body = self.base_patient_json
+        else:
+            body = json.dumps(self.patient_data)
+        return self.client.post("/api/patients", data=body, content_type="application/json")
+
+    def _create_existing_patient(self, first_name="John"):
+        """Create a patient on the default MRN; pass another first name to force a name mismatch"""
+        return Patient.objects.create(
+            first_name=first_name,
+            last_name="Doe",
+            mrn=_MRN,
+            primary_diagnosis=_DX,
+            provider=self.provider
+        )
+
+    def _assert_requires_confirmation(self, response, issue):
+        self.assertEqual(response.status_code, 422)
+        data = orjson.loads(response.content)
+        self.assertTrue(data["requires_confirmation"])
+        self.assertIn(issue, data.get("issues", {}))
 
     def test_create_patient_and_order_success(self):
         """Test creating a new patient and order"""
-        response = self.client.post("/api/patients", data=json.dumps(self.patient_data), content_type="application/json")
+        response = self._post_patient()
         self.assertEqual(response.status_code, 200)
-        data = response.json()
+        data = orjson.loads(response.content)
         self.assertIn("patient_id", data)
         self.assertIn("order_id", data)
         self.assertIn("message", data)
@@ -92,11 +189,11 @@ class PatientAPITests(TestCase):
         patient = Patient.objects.get(id=data["patient_id"])
         self.assertEqual(patient.first_name, "John")
         self.assertEqual(patient.last_name, "Doe")
-        self.assertEqual(patient.mrn, "123456")
+        self.assertEqual(patient.mrn, _MRN)
         
         # Verify order was created
         order = Order.objects.get(id=data["order_id"])
-        self.assertEqual(order.medication_name, "IVIG")
+        self.assertEqual(order.medication_name, _MED)
         self.assertEqual(order.patient, patient)
 
     def test_create_patient_creates_provider_if_not_exists(self):
@@ -105,7 +202,7 @@ class PatientAPITests(TestCase):
         self.patient_data["provider_npi"] = new_npi
         self.patient_data["referring_provider"] = "Dr. New"
         
-        response = self.client.post("/api/patients", data=json.dumps(self.patient_data), content_type="application/json")
+        response = self._post_patient()
         self.assertEqual(response.status_code, 200)
         
         # Verify provider was created
@@ -114,163 +211,285 @@ class PatientAPITests(TestCase):
 
     def test_create_patient_provider_name_mismatch_requires_confirmation(self):
         """Test that provider name mismatch requires confirmation"""
-        # Create provider with different name
-        Provider.objects.update_or_create(npi="1234567890", defaults={"name": "Dr. Original"})
+        # Rename the existing provider so the payload's name no longer matches
+        Provider.objects.filter(npi=_NPI).update(name="Dr. Original")
         
         # Try to create patient with same NPI but different name
-        response = self.client.post("/api/patients", data=json.dumps(self.patient_data), content_type="application/json")
-        self.assertEqual(response.status_code, 422)
-        data = response.json()
-        self.assertIn("requires_confirmation", data)
-        self.assertTrue(data["requires_confirmation"])
-        self.assertIn("provider", data.get("issues", {}))
+        self._assert_requires_confirmation(self._post_patient(), "provider")
 
     def test_create_patient_provider_name_mismatch_with_confirmation(self):
         """Test that provider name mismatch can proceed with confirmation"""
-        # Create provider with different name
-        provider, _ = Provider.objects.update_or_create(npi="1234567890", defaults={"name": "Dr. Original"})
+        # Rename the existing provider so the payload's name no longer matches
+        Provider.objects.filter(npi=_NPI).update(name="Dr. Original")
         
         # Create patient with confirmation flag
         self.patient_data["confirm_provider_name_mismatch"] = True
-        response = self.client.post("/api/patients", data=json.dumps(self.patient_data), content_type="application/json")
+        response = self._post_patient()
         self.assertEqual(response.status_code, 200)
         
         # Provider name should be updated
-        provider.refresh_from_db()
-        self.assertEqual(provider.name, "Dr. Smith")
+        self.provider.refresh_from_db()
+        self.assertEqual(self.provider.name, "Dr. Smith")
+
+    def test_create_patient_non_ascii_names_match(self):
+        """Test that identical non-ASCII provider and patient names aren't reported as mismatches"""
+        Provider.objects.filter(npi=_NPI).update(name="Dr. Émile Zoë")
+        self._create_existing_patient(first_name="Zoë")
+        self.patient_data["referring_provider"] = "Dr. Émile Zoë"
+        self.patient_data["first_name"] = "Zoë"
+
+        response = self._post_patient()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(orjson.loads(response.content)["message"], "Patient and order created successfully.")
 
     def test_create_patient_patient_name_mismatch_requires_confirmation(self):
         """Test that patient name mismatch requires confirmation"""
         # Create existing patient
-        existing_patient = Patient.objects.create(
-            first_name="Jane",
-            last_name="Doe",
-            mrn="123456",
-            primary_diagnosis="G70.00",
-            provider=self.provider
-        )
+        self._create_existing_patient(first_name="Jane")
         
         # Try to create patient with same MRN but different name
-        response = self.client.post("/api/patients", data=json.dumps(self.patient_data), content_type="application/json")
-        self.assertEqual(response.status_code, 422)
-        data = response.json()
-        self.assertIn("requires_confirmation", data)
-        self.assertIn("patient", data.get("issues", {}))
+        self._assert_requires_confirmation(self._post_patient(), "patient")
 
     def test_create_patient_patient_name_mismatch_with_confirmation(self):
         """Test that patient name mismatch can proceed with confirmation"""
         # Create existing patient
-        Patient.objects.create(
-            first_name="Jane",
-            last_name="Doe",
-            mrn="123456",
-            primary_diagnosis="G70.00",
-            provider=self.provider
-        )
+        self._create_existing_patient(first_name="Jane")
         
         # Create order for existing patient with confirmation
         self.patient_data["confirm_patient_name_mismatch"] = True
-        response = self.client.post("/api/patients", data=json.dumps(self.patient_data), content_type="application/json")
+        response = self._post_patient()
         self.assertEqual(response.status_code, 200)
         
-        # Patient should exist, new order should be created
-        patient = Patient.objects.get(mrn="123456")
-        orders = Order.objects.filter(patient=patient, medication_name="IVIG")
-        self.assertEqual(orders.count(), 1)
+        # Patient should exist, new order should be created (one JOINed count)
+        self.assertEqual(Order.objects.filter(patient__mrn=_MRN, medication_name=_MED).count(), 1)
+
+    def test_create_patient_concurrent_npi_name_mismatch(self):
+        """Test that a provider inserted after the lookup still gets the name check"""
+        self.patient_data["referring_provider"] = "Dr. New"
+
+        def lookup_before_concurrent_insert(payload):
+            # Simulate the other request's INSERT landing between our lookup and ours
+            _, patient, existing_order_id = _find_existing_records(payload)
+            return None, patient, existing_order_id
+
+        with mock.patch("patients.api._find_existing_records", side_effect=lookup_before_concurrent_insert):
+            self._assert_requires_confirmation(self._post_patient(), "provider")
+            self.assertFalse(Patient.objects.filter(mrn=_MRN).exists())
+
+            self.patient_data["confirm_provider_name_mismatch"] = True
+            response = self._post_patient()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Provider name updated", orjson.loads(response.content)["message"])
+        self.provider.refresh_from_db()
+        self.assertEqual(self.provider.name, "Dr. New")
+
+    def test_create_patient_concurrent_mrn_name_mismatch(self):
+        """Test that a patient inserted after the lookup still gets the name check"""
+        self._create_existing_patient(first_name="Jane")
+        self.patient_data["referring_provider"] = "Dr. New"
+        self.patient_data["confirm_provider_name_mismatch"] = True
+
+        def lookup_before_concurrent_insert(payload):
+            # Simulate the other request's INSERT landing between our lookup and ours
+            provider, _, _ = _find_existing_records(payload)
+            return provider, None, None
+
+        with mock.patch("patients.api._find_existing_records", side_effect=lookup_before_concurrent_insert):
+            self._assert_requires_confirmation(self._post_patient(), "patient")
+            # The confirmed provider rename is rolled back with the rejected order
+            self.provider.refresh_from_db()
+            self.assertEqual(self.provider.name, "Dr. Smith")
+
+            self.patient_data["confirm_patient_name_mismatch"] = True
+            response = self._post_patient()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("existing patient", orjson.loads(response.content)["message"])
+        self.assertEqual(Order.objects.filter(patient__mrn=_MRN).count(), 1)
 
     def test_create_patient_duplicate_order_requires_confirmation(self):
         """Test that duplicate order requires confirmation"""
         # Create patient and order
-        patient = Patient.objects.create(
-            first_name="John",
-            last_name="Doe",
-            mrn="123456",
-            primary_diagnosis="G70.00",
-            provider=self.provider
-        )
-        Order.objects.create(patient=patient, medication_name="IVIG")
+        patient = self._create_existing_patient()
+        Order.objects.create(patient=patient, medication_name=_MED)
         
         # Try to create duplicate order
         self.patient_data["confirm_patient_name_mismatch"] = True
-        response = self.client.post("/api/patients", data=json.dumps(self.patient_data), content_type="application/json")
-        self.assertEqual(response.status_code, 422)
-        data = response.json()
-        self.assertIn("requires_confirmation", data)
-        self.assertIn("order", data.get("issues", {}))
+        self._assert_requires_confirmation(self._post_patient(), "order")
 
     def test_create_patient_duplicate_order_with_confirmation(self):
         """Test that duplicate order can proceed with confirmation"""
         # Create patient and order
-        patient = Patient.objects.create(
-            first_name="John",
-            last_name="Doe",
-            mrn="123456",
-            primary_diagnosis="G70.00",
-            provider=self.provider
-        )
-        Order.objects.create(patient=patient, medication_name="IVIG")
+        patient = self._create_existing_patient()
+        Order.objects.create(patient=patient, medication_name=_MED)
         
         # Create duplicate order with confirmation
         self.patient_data["confirm_patient_name_mismatch"] = True
         self.patient_data["confirm_duplicate_order"] = True
-        response = self.client.post("/api/patients", data=json.dumps(self.patient_data), content_type="application/json")
+        response = self._post_patient()
         self.assertEqual(response.status_code, 200)
         
-        # Both orders should exist
-        orders = Order.objects.filter(patient=patient, medication_name="IVIG")
-        self.assertEqual(orders.count(), 2)
+        # Both orders should exist; the patient has no others
+        self.assertEqual(Order.objects.filter(patient_id=patient.id).count(), 2)
 
     def test_list_patients(self):
         """Test listing all patients"""
         # Create patients
-        patient1 = Patient.objects.create(
+        Patient.objects.bulk_create([
+            Patient(
+                first_name="John",
+                last_name="Doe",
+                mrn=_MRN,
+                primary_diagnosis=_DX,
+                provider=self.provider
+            ),
+            Patient(
+                first_name="Jane",
+                last_name="Smith",
+                mrn="789012",
+                primary_diagnosis="I10",
+                provider=self.provider
+            ),
+        ])
+        
+        response = self.client.get("/api/patients")
+        self.assertEqual(response.status_code, 200)
+        data = orjson.loads(response.content)
+        self.assertEqual(len(data), 2)
+        
+        mrns = [p["mrn"] for p in data]
+        self.assertIn(_MRN, mrns)
+        self.assertIn("789012", mrns)
+        # Records blob is served separately
+        self.assertNotIn("records_text", data[0])
+
+    def test_list_patients_query_count(self):
+        """Test that listing patients doesn't query the provider per row"""
+        other_provider = Provider.objects.create(name="Dr. Jones", npi="0987654321")
+        Patient.objects.bulk_create([
+            Patient(
+                first_name="John",
+                last_name="Doe",
+                mrn=f"12345{i}",
+                primary_diagnosis=_DX,
+                provider=provider
+            )
+            for i, provider in enumerate([self.provider, other_provider, self.provider])
+        ])
+        
+        # One page-sized query for the ETag, one joined SELECT for the rows
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/patients")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [p["provider_npi"] for p in orjson.loads(response.content)],
+            [_NPI, "0987654321", _NPI]
+        )
+
+    def test_list_patients_cursor_pagination(self):
+        """Test paging through patients with cursor/limit"""
+        Patient.objects.bulk_create([
+            Patient(
+                first_name="John",
+                last_name="Doe",
+                mrn=f"12345{i}",
+                primary_diagnosis=_DX,
+                provider=self.provider
+            )
+            for i in range(3)
+        ])
+        
+        response = self.client.get("/api/patients?limit=2")
+        self.assertEqual(response.status_code, 200)
+        first_page = orjson.loads(response.content)
+        self.assertEqual([p["mrn"] for p in first_page], ["123450", "123451"])
+        
+        response = self.client.get(f"/api/patients?limit=2&cursor={first_page[-1]['id']}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p["mrn"] for p in orjson.loads(response.content)], ["123452"])
+
+    def test_list_patients_etag(self):
+        """Test conditional GET on the patient list"""
+        Patient.objects.create(
             first_name="John",
             last_name="Doe",
-            mrn="123456",
-            primary_diagnosis="G70.00",
+            mrn=_MRN,
+            primary_diagnosis=_DX,
             provider=self.provider
         )
-        patient2 = Patient.objects.create(
+        
+        response = self.client.get("/api/patients")
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+        
+        response = self.client.get("/api/patients", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        # Renaming the provider changes the listed data, so the ETag must change
+        self.provider.name = "Dr. Renamed"
+        self.provider.save()
+        response = self.client.get("/api/patients", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(orjson.loads(response.content)[0]["referring_provider"], "Dr. Renamed")
+        
+        # A patient past the end of a full page leaves that page's ETag alone
+        response = self.client.get("/api/patients?limit=1")
+        etag = response.headers["ETag"]
+        Patient.objects.create(
             first_name="Jane",
-            last_name="Smith",
-            mrn="789012",
-            primary_diagnosis="I10",
+            last_name="Roe",
+            mrn="654321",
+            primary_diagnosis=_DX,
+            provider=self.provider
+        )
+        response = self.client.get("/api/patients?limit=1", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_get_patient_records(self):
+        """Test fetching a patient's records text"""
+        patient = Patient.objects.create(
+            first_name="John",
+            last_name="Doe",
+            mrn=_MRN,
+            primary_diagnosis=_DX,
+            records_text="Patient records here",
             provider=self.provider
         )
         
-        response = self.client.get("/api/patients")
+        response = self.client.get(f"/api/patients/{patient.id}/records")
         self.assertEqual(response.status_code, 200)
-        data = response.json()
-        self.assertEqual(len(data), 2)
-        
-        mrns = [p["mrn"] for p in data]
-        self.assertIn("123456", mrns)
-        self.assertIn("789012", mrns)
+        data = orjson.loads(response.content)
+        self.assertEqual(data["id"], patient.id)
+        self.assertEqual(data["records_text"], "Patient records here")
+
+    def test_get_patient_records_invalid_patient(self):
+        """Test records for a non-existent patient"""
+        response = self.client.get("/api/patients/99999/records")
+        self.assertEqual(response.status_code, 404)
 
 
 class OrderAPITests(TestCase):
-    def setUp(self):
-        self.client = Client()
-        self.provider = Provider.objects.create(name="Dr. Smith", npi="1234567890")
-        self.patient = Patient.objects.create(
+    @classmethod
+    def setUpTestData(cls):
+        cls.provider = Provider.objects.create(name="Dr. Smith", npi=_NPI)
+        cls.patient = Patient.objects.create(
             first_name="John",
             last_name="Doe",
-            mrn="123456",
-            primary_diagnosis="G70.00",
-            provider=self.provider
+            mrn=_MRN,
+            primary_diagnosis=_DX,
+            provider=cls.provider
         )
 
     def test_create_order_success(self):
         """Test creating a new order"""
         order_data = {
             "patient_id": self.patient.id,
-            "medication_name": "IVIG"
+            "medication_name": _MED
         }
         
         response = self.client.post("/api/orders", data=json.dumps(order_data), content_type="application/json")
         self.assertEqual(response.status_code, 200)
-        data = response.json()
-        self.assertEqual(data["medication_name"], "IVIG")
+        data = orjson.loads(response.content)
+        self.assertEqual(data["medication_name"], _MED)
         self.assertEqual(data["patient_id"], self.patient.id)
         self.assertIn("id", data)
         
@@ -281,57 +500,298 @@ class OrderAPITests(TestCase):
         """Test creating order with non-existent patient"""
         order_data = {
             "patient_id": 99999,
-            "medication_name": "IVIG"
+            "medication_name": _MED
         }
         
         response = self.client.post("/api/orders", data=json.dumps(order_data), content_type="application/json")
         self.assertEqual(response.status_code, 404)
 
+    def test_create_order_non_ascii_duplicate_warning(self):
+        """Test that a repeated non-ASCII medication name is flagged as a duplicate"""
+        Order.objects.create(patient=self.patient, medication_name="Éculizumab")
+        order_data = {"patient_id": self.patient.id, "medication_name": "Éculizumab"}
+
+        response = self.client.post("/api/orders", data=json.dumps(order_data), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(orjson.loads(response.content)["warning"])
+
+        response = self.client.post("/api/orders/bulk", data=json.dumps([order_data]), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(orjson.loads(response.content)[0]["warning"])
+
+    def test_create_orders_bulk(self):
+        """Test creating several orders in one request"""
+        Order.objects.create(patient=self.patient, medication_name=_MED)
+        orders_data = [
+            {"patient_id": self.patient.id, "medication_name": "ivig"},
+            {"patient_id": self.patient.id, "medication_name": "Aspirin"},
+            {"patient_id": self.patient.id, "medication_name": "aspirin"},
+        ]
+        
+        response = self.client.post("/api/orders/bulk", data=json.dumps(orders_data), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        data = orjson.loads(response.content)
+        self.assertEqual(len(data), 3)
+        self.assertTrue(all("id" in o for o in data))
+        # Existing and in-payload duplicates are flagged, first Aspirin is not
+        self.assertIsNotNone(data[0]["warning"])
+        self.assertIsNone(data[1]["warning"])
+        self.assertIsNotNone(data[2]["warning"])
+        self.assertEqual(Order.objects.count(), 4)
+
+    def test_create_orders_bulk_invalid_patient(self):
+        """Test bulk order creation with a non-existent patient creates nothing"""
+        orders_data = [
+            {"patient_id": self.patient.id, "medication_name": _MED},
+            {"patient_id": 99999, "medication_name": _MED},
+        ]
+        
+        response = self.client.post("/api/orders/bulk", data=json.dumps(orders_data), content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Order.objects.count(), 0)
+
     def test_list_orders(self):
         """Test listing all orders"""
-        Order.objects.create(patient=self.patient, medication_name="IVIG")
-        Order.objects.create(patient=self.patient, medication_name="Aspirin")
+        Order.objects.bulk_create([
+            Order(patient=self.patient, medication_name=_MED),
+            Order(patient=self.patient, medication_name="Aspirin"),
+        ])
         
-        response = self.client.get("/api/orders")
+        # One page-sized query for the ETag, one SELECT for the rows
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/orders")
         self.assertEqual(response.status_code, 200)
-        data = response.json()
+        self.assertEqual(response.headers["Content-Type"], "application/json; charset=utf-8")
+        data = orjson.loads(response.content)
         self.assertEqual(len(data), 2)
 
+    def test_list_orders_etag(self):
+        """Test conditional GET on the order list"""
+        Order.objects.create(patient=self.patient, medication_name=_MED)
+        
+        response = self.client.get("/api/orders")
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+        
+        response = self.client.get("/api/orders", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        Order.objects.create(patient=self.patient, medication_name="Aspirin")
+        response = self.client.get("/api/orders", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(orjson.loads(response.content)), 2)
+
+
+@tag("slow")
+class PDFExtractionTests(TestCase):
+    def test_extract_records_text_success(self):
+        """Test extracting text from an uploaded PDF"""
+        upload = SimpleUploadedFile("records.pdf", _MINIMAL_PDF_BYTES, content_type="application/pdf")
+        response = self.client.post("/api/records/extract", {"file": upload})
+        self.assertEqual(response.status_code, 200)
+        data = orjson.loads(response.content)
+        self.assertIn("Patient records", data["extracted_text"])
+
+    def test_extract_records_text_parallel(self):
+        """Test that a larger PDF is extracted through the process pool, pages in order"""
+        upload = SimpleUploadedFile("records.pdf", _MULTI_PAGE_PDF_BYTES, content_type="application/pdf")
+        with mock.patch.object(records_service, "_extract_in_pool", wraps=records_service._extract_in_pool) as pool:
+            response = self.client.post("/api/records/extract", {"file": upload})
+        self.assertEqual(response.status_code, 200)
+        pool.assert_called_once()
+        text = orjson.loads(response.content)["extracted_text"]
+        positions = [text.find(page_text) for page_text in _MULTI_PAGE_PDF_TEXTS]
+        self.assertNotIn(-1, positions)
+        self.assertEqual(positions, sorted(positions))
+
+    def test_extract_records_text_recovers_from_broken_pool(self):
+        """Test that a pool broken by a dead worker is replaced on the next extraction"""
+        executor = records_service._get_executor()
+        with self.assertRaises(BrokenProcessPool):
+            executor.submit(os._exit, 1).result()
+
+        upload = SimpleUploadedFile("records.pdf", _MULTI_PAGE_PDF_BYTES, content_type="application/pdf")
+        response = self.client.post("/api/records/extract", {"file": upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Page 1", orjson.loads(response.content)["extracted_text"])
+        self.assertIsNot(records_service._get_executor(), executor)
+
+    def test_extract_records_text_invalid_file(self):
+        """Test that a non-PDF upload is rejected"""
+        upload = SimpleUploadedFile("records.pdf", b"not a pdf", content_type="application/pdf")
+        response = self.client.post("/api/records/extract", {"file": upload})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", orjson.loads(response.content))
+
+
+def _completion_stream(*texts):
+    """
+    Build an async stream of chat-completion chunks carrying the given text deltas.
+    """
+    async def stream():
+        for text in texts:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+    return stream()
+
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    Answer chat completion requests with a short server-sent event stream, as the OpenAI API does.
+    """
+    texts = ("PLAN ", "BODY")
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for text in self.texts:
+            chunk = {
+                "id": "chatcmpl-test",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": "gpt-4o",
+                "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+            }
+            self.wfile.write(b"data: " + orjson.dumps(chunk) + b"\n\n")
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, format, *args):
+        pass
 
 
 class CarePlanTests(TestCase):
-    def setUp(self):
-        self.client = Client()
-        self.provider = Provider.objects.create(name="Dr. Smith", npi="1234567890")
-        self.patient = Patient.objects.create(
+    @classmethod
+    def setUpTestData(cls):
+        cls.provider = Provider.objects.create(name="Dr. Smith", npi=_NPI)
+        cls.patient = Patient.objects.create(
             first_name="John",
             last_name="Doe",
-            mrn="123456",
-            primary_diagnosis="G70.00",
-            provider=self.provider,
+            mrn=_MRN,
+            primary_diagnosis=_DX,
+            provider=cls.provider,
             records_text="Test records"
         )
-        self.order = Order.objects.create(
-            patient=self.patient,
-            medication_name="IVIG"
+        cls.order = Order.objects.create(
+            patient=cls.patient,
+            medication_name=_MED
         )
 
-    def test_get_care_plan_success(self):
+    def setUp(self):
+        # Generated plans are cached by prompt; start every test cold
+        cache.clear()
+
+    @mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test-key"})
+    @mock.patch("patients.care_plan_service._get_client")
+    async def test_get_care_plan_success(self, mock_get_client):
         """Test generating care plan"""
-        # Mock the OpenAI call - in real tests you'd use a mock
-        # For now, this will try to actually call OpenAI
+        mock_create = mock.AsyncMock(return_value=_completion_stream("PLAN ", "TEXT"))
+        mock_get_client.return_value.chat.completions.create = mock_create
+        
+        response = await self.async_client.get(
+            f"/api/patients/{self.patient.id}/orders/{self.order.id}/care-plan"
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "text/plain; charset=utf-8")
+        self.assertIn("attachment", response.headers.get("Content-Disposition", ""))
+        content = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn("CLINICAL CARE PLAN", content)
+        self.assertTrue(content.endswith("PLAN TEXT"))
+        mock_create.assert_called_once()
+
+    @mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test-key"})
+    @mock.patch("patients.care_plan_service._get_client")
+    async def test_get_care_plan_cached(self, mock_get_client):
+        """Test that a repeat download is served from cache without calling OpenAI"""
+        mock_create = mock.AsyncMock(return_value=_completion_stream("PLAN TEXT"))
+        mock_get_client.return_value.chat.completions.create = mock_create
+        url = f"/api/patients/{self.patient.id}/orders/{self.order.id}/care-plan"
+        
+        first = await self.async_client.get(url)
+        first_content = b"".join([chunk async for chunk in first.streaming_content])
+        second = await self.async_client.get(url)
+        second_content = b"".join([chunk async for chunk in second.streaming_content])
+        
+        self.assertEqual(first_content, second_content)
+        mock_create.assert_called_once()
+
+    @mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test-key"})
+    @mock.patch("patients.care_plan_service._get_client")
+    async def test_get_care_plan_stream_failure_is_marked(self, mock_get_client):
+        """Test that a stream failing partway ends the download with a visible marker"""
+        async def failing_stream():
+            async for chunk in _completion_stream("PLAN "):
+                yield chunk
+            raise RuntimeError("connection reset")
+        mock_get_client.return_value.chat.completions.create = mock.AsyncMock(return_value=failing_stream())
+        
+        response = await self.async_client.get(
+            f"/api/patients/{self.patient.id}/orders/{self.order.id}/care-plan"
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        content = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertTrue(content.endswith("PLAN " + CARE_PLAN_INCOMPLETE_MARKER))
+
+    @mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test-key"})
+    @mock.patch("patients.care_plan_service._get_client")
+    async def test_get_care_plan_empty_completion_async(self, mock_get_client):
+        """Test that an empty completion is an error rather than a blank streamed plan"""
+        mock_get_client.return_value.chat.completions.create = mock.AsyncMock(return_value=_completion_stream())
+        
+        response = await self.async_client.get(
+            f"/api/patients/{self.patient.id}/orders/{self.order.id}/care-plan"
+        )
+        
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("empty response", orjson.loads(response.content)["error"])
+
+    @mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test-key"})
+    @mock.patch("patients.care_plan_service._get_client")
+    def test_get_care_plan_empty_completion_sync(self, mock_get_client):
+        """Test that an empty completion is an error rather than a blank plan under WSGI"""
+        mock_get_client.return_value.chat.completions.create = mock.AsyncMock(return_value=_completion_stream())
+        
         response = self.client.get(
             f"/api/patients/{self.patient.id}/orders/{self.order.id}/care-plan"
         )
         
-        # If OpenAI key is set, this should work (200 or 500)
-        # If not set, it will fail gracefully
-        self.assertIn(response.status_code, [200, 500])
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("empty response", orjson.loads(response.content)["error"])
+
+    @mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test-key"})
+    def test_get_care_plan_sync_client_real_openai_client(self):
+        """Test the WSGI path end to end with a real AsyncOpenAI client against a local server"""
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeOpenAIHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        
+        with mock.patch(
+            "patients.care_plan_service._get_client",
+            side_effect=lambda api_key: AsyncOpenAI(api_key=api_key, base_url=base_url),
+        ):
+            response = self.client.get(
+                f"/api/patients/{self.patient.id}/orders/{self.order.id}/care-plan"
+            )
         
-        # If successful, should return text file
-        if response.status_code == 200:
-            self.assertEqual(response.headers["content-type"], "text/plain; charset=utf-8")
-            self.assertIn("attachment", response.headers.get("Content-Disposition", ""))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("attachment", response.headers.get("Content-Disposition", ""))
+        content = response.content.decode()
+        self.assertIn("CLINICAL CARE PLAN", content)
+        self.assertTrue(content.endswith("PLAN BODY"))
+
+    @mock.patch.dict(os.environ, {"OPENAI_API_KEY": ""})
+    def test_get_care_plan_missing_api_key(self):
+        """Test care plan without an OpenAI key configured"""
+        response = self.client.get(
+            f"/api/patients/{self.patient.id}/orders/{self.order.id}/care-plan"
+        )
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("error", orjson.loads(response.content))
 
     def test_get_care_plan_invalid_patient(self):
         """Test care plan with non-existent patient"""
@@ -371,48 +831,43 @@ class CarePlanTests(TestCase):
 class IntegrationTests(TestCase):
     """Integration tests for full workflow"""
     
-    def setUp(self):
-        self.client = Client()
-        self.provider_data = {
-            "name": "Dr. Smith",
-            "npi": "1234567890"
-        }
+    # Request bodies are fixed, so encode them once for the class
+    provider_json = json.dumps({
+        "name": "Dr. Smith",
+        "npi": _NPI
+    })
+    patient_json = json.dumps({
+        "first_name": "John",
+        "last_name": "Doe",
+        "mrn": _MRN,
+        "primary_diagnosis": _DX,
+        "referring_provider": "Dr. Smith",
+        "provider_npi": _NPI,
+        "medication_name": _MED,
+        "records_text": "Patient records",
+        "confirm_patient_name_mismatch": False,
+        "confirm_provider_name_mismatch": False,
+        "confirm_duplicate_order": False
+    })
 
     def test_full_patient_workflow(self):
         """Test complete workflow: create provider -> create patient -> create order"""
         # Create provider
-        provider_response = self.client.post("/api/providers", data=json.dumps(self.provider_data), content_type="application/json")
+        provider_response = self.client.post("/api/providers", data=self.provider_json, content_type="application/json")
         self.assertEqual(provider_response.status_code, 200)
         
         # Create patient with order
-        patient_data = {
-            "first_name": "John",
-            "last_name": "Doe",
-            "mrn": "123456",
-            "primary_diagnosis": "G70.00",
-            "referring_provider": "Dr. Smith",
-            "provider_npi": "1234567890",
-            "medication_name": "IVIG",
-            "records_text": "Patient records",
-            "confirm_patient_name_mismatch": False,
-            "confirm_provider_name_mismatch": False,
-            "confirm_duplicate_order": False
-        }
-        
-        patient_response = self.client.post("/api/patients", data=json.dumps(patient_data), content_type="application/json")
+        patient_response = self.client.post("/api/patients", data=self.patient_json, content_type="application/json")
         self.assertEqual(patient_response.status_code, 200)
         
-        patient_json = patient_response.json()
+        patient_json = orjson.loads(patient_response.content)
         patient_id = patient_json["patient_id"]
         order_id = patient_json["order_id"]
         
-        # Verify patient exists
-        self.assertTrue(Patient.objects.filter(id=patient_id).exists())
-        
-        # Verify order exists
-        self.assertTrue(Order.objects.filter(id=order_id).exists())
+        # Verify the order exists and belongs to the new patient
+        self.assertTrue(Order.objects.filter(id=order_id, patient_id=patient_id).exists())
         
         # List patients
         list_response = self.client.get("/api/patients")
         self.assertEqual(list_response.status_code, 200)
-        self.assertEqual(len(list_response.json()), 1)
+        self.assertEqual(len(orjson.loads(list_response.content)), 1)